@@ -1,13 +1,16 @@
+import asyncio
+import contextlib
 import os
 import sqlite3
 import time
-import base64
 import json
 import logging
-from typing import Optional, Dict
+from collections import OrderedDict
+from secrets import token_urlsafe
+from typing import AsyncIterator, Optional, Dict, List
 
 from pydantic import BaseModel
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from webauthn import (
     generate_registration_options,
@@ -16,12 +19,18 @@ from webauthn import (
     verify_authentication_response,
     options_to_json,
 )
+from webauthn.helpers import base64url_to_bytes, bytes_to_base64url, generate_challenge
 from webauthn.helpers.structs import (
     AuthenticatorSelectionCriteria,
     UserVerificationRequirement,
 )
+import aiosqlite
 import jwt
-from cryptography.hazmat.primitives.asymmetric import rsa
+import orjson
+import redis.asyncio as redis
+from cachetools import TLRUCache
+from pybloom_live import ScalableBloomFilter
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
 
@@ -30,7 +39,29 @@ from cryptography.hazmat.backends import default_backend
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
 logger = logging.getLogger("auth_server")
 
-app = FastAPI(title="Huddle Auth Server")
+
+# The DB pool is opened on startup so every connection is warm before the first request.
+@contextlib.asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    await db_pool.open()
+    await load_revoked_jtis()
+    feed_task = None
+    if redis_client is None:
+        # Single worker: this process sees every revocation, so the filter is complete.
+        set_revoked_filter_complete(True)
+    else:
+        feed_task = asyncio.create_task(follow_revoked_jtis())
+    try:
+        yield
+    finally:
+        if feed_task is not None:
+            feed_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await feed_task
+        await db_pool.close()
+
+
+app = FastAPI(title="Huddle Auth Server", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -55,12 +86,35 @@ AUTH_PORT = int(os.environ.get("AUTH_PORT", "8081"))
 
 ENABLE_DEV_AUTH_FALLBACK = env_flag("ENABLE_DEV_AUTH_FALLBACK", "true")
 JWT_EXPIRY_SECONDS = 8 * 60 * 60  # 8 hours
+JWT_ALGORITHM = "EdDSA"  # Ed25519
+
+REGISTRATION_CHALLENGE_TTL_SECONDS = 300
+AUTHENTICATION_CHALLENGE_TTL_SECONDS = 120
+REDIS_URL = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0")
+CHALLENGE_STORE_IN_MEMORY = env_flag("CHALLENGE_STORE_IN_MEMORY")
+REVOKED_JTI_CHANNEL = "huddle:revoked_jtis"
 
 DB_FILE = "auth.db"
 PRIVATE_KEY_FILE = os.environ.get("JWT_PRIVATE_KEY_FILE", "auth_private_key.pem")
 PUBLIC_KEY_FILE = os.environ.get("JWT_PUBLIC_KEY_FILE", "auth_public_key.pem")
 
 
+def read_file_or_none(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_file_atomic(path: str, data: bytes) -> None:
+    # Concurrently starting workers never see (or leave behind) a half-written key file.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
 def load_or_create_jwt_keys() -> tuple[bytes, bytes]:
     if os.path.exists(PRIVATE_KEY_FILE):
         with open(PRIVATE_KEY_FILE, "rb") as private_file:
@@ -70,24 +124,24 @@ def load_or_create_jwt_keys() -> tuple[bytes, bytes]:
             password=None,
             backend=default_backend(),
         )
-        loaded_public_key = loaded_private_key.public_key()
-        public_pem = loaded_public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo,
-        )
+        if isinstance(loaded_private_key, Ed25519PrivateKey):
+            loaded_public_key = loaded_private_key.public_key()
+            public_pem = loaded_public_key.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo,
+            )
 
-        # Keep public key file in sync for easier debugging/inspection.
-        with open(PUBLIC_KEY_FILE, "wb") as public_file:
-            public_file.write(public_pem)
+            # Keep public key file in sync for easier debugging/inspection.
+            if read_file_or_none(PUBLIC_KEY_FILE) != public_pem:
+                write_file_atomic(PUBLIC_KEY_FILE, public_pem)
 
-        logger.info("Loaded persisted JWT key pair from disk.")
-        return private_pem, public_pem
+            logger.info("Loaded persisted JWT key pair from disk.")
+            return private_pem, public_pem
 
-    generated_private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-        backend=default_backend(),
-    )
+        # One-time migration from the old RS256 key; tokens it signed stop verifying.
+        logger.warning("Persisted JWT key is not Ed25519; replacing it with a new key pair.")
+
+    generated_private_key = Ed25519PrivateKey.generate()
     generated_public_key = generated_private_key.public_key()
 
     private_pem = generated_private_key.private_bytes(
@@ -100,27 +154,143 @@ def load_or_create_jwt_keys() -> tuple[bytes, bytes]:
         format=serialization.PublicFormat.SubjectPublicKeyInfo,
     )
 
-    with open(PRIVATE_KEY_FILE, "wb") as private_file:
-        private_file.write(private_pem)
-    with open(PUBLIC_KEY_FILE, "wb") as public_file:
-        public_file.write(public_pem)
+    write_file_atomic(PRIVATE_KEY_FILE, private_pem)
+    write_file_atomic(PUBLIC_KEY_FILE, public_pem)
 
     logger.info("Generated new JWT key pair and persisted it to disk.")
     return private_pem, public_pem
 
 
 PRIVATE_KEY_PEM, PUBLIC_KEY_PEM = load_or_create_jwt_keys()
+# Parsed once so PyJWT doesn't re-decode the PEM on every encode/decode.
+_SIGNING_KEY = serialization.load_pem_private_key(PRIVATE_KEY_PEM, password=None, backend=default_backend())
+_VERIFY_KEY = serialization.load_pem_public_key(PUBLIC_KEY_PEM, backend=default_backend())
+
+
+# --- SQL ---
+# Shared statement strings, so every pooled connection hits its prepared-statement cache.
+SQL_GET_USER_BY_NAME = "SELECT id FROM users WHERE username = ?"
+# On conflict the existing row keeps its id; a blank display name leaves the old one in place.
+SQL_UPSERT_USER = """
+    INSERT INTO users (id, username, display_name) VALUES (?, ?, ?)
+    ON CONFLICT(username) DO UPDATE SET display_name = COALESCE(NULLIF(?, ''), users.display_name)
+    RETURNING id
+"""
+SQL_REVOKE_USER_TOKENS = "UPDATE users SET tokens_valid_after = ? WHERE id = ?"
+SQL_GET_TOKENS_VALID_AFTER = "SELECT tokens_valid_after FROM users WHERE id = ?"
+SQL_INSERT_CRED = """
+    INSERT INTO passkey_creds (id, user_id, public_key, sign_count, transports, device_fingerprint)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+SQL_GET_LOGIN_CRED = """
+    SELECT u.id, pc.public_key, pc.sign_count
+    FROM users u JOIN passkey_creds pc ON pc.user_id = u.id
+    WHERE u.username = ? AND pc.id = ? AND pc.device_fingerprint = ?
+"""
+# Failure path only: tells apart unknown user, unknown credential and device mismatch.
+SQL_GET_LOGIN_FAILURE = """
+    SELECT u.id, pc.device_fingerprint
+    FROM users u LEFT JOIN passkey_creds pc ON pc.user_id = u.id AND pc.id = ?
+    WHERE u.username = ?
+"""
+SQL_REVOKE_JTI = "INSERT OR IGNORE INTO revoked_jtis (jti, revoked_at) VALUES (?, ?)"
+SQL_IS_JTI_REVOKED = "SELECT 1 FROM revoked_jtis WHERE jti = ?"
+SQL_GET_REVOKED_JTIS = "SELECT jti FROM revoked_jtis"
+SQL_UPDATE_SIGNCOUNT = "UPDATE passkey_creds SET sign_count = ? WHERE id = ?"
+SQL_BIND_DEVICE = """
+    INSERT OR IGNORE INTO device_bindings (user_id, device_fingerprint, created_at)
+    VALUES (?, ?, ?)
+"""
+SQL_GET_DEVICE_BINDING = "SELECT 1 FROM device_bindings WHERE user_id = ? AND device_fingerprint = ?"
 
 
 # --- Database Setup ---
-def get_db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_FILE)
+async def _apply_pragmas(conn: aiosqlite.Connection) -> None:
+    # Per-connection settings; journal_mode=WAL is persisted in the file by init_db().
+    # executescript() leaves no cursor behind holding a statement open.
+    await conn.executescript(
+        """
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-64000;
+        PRAGMA mmap_size=268435456;
+        PRAGMA busy_timeout=5000;
+    """
+    )
+
+
+async def open_db() -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(DB_FILE, cached_statements=128)
     conn.row_factory = sqlite3.Row
+    await _apply_pragmas(conn)
     return conn
 
 
+class ConnectionPool:
+    """Fixed-size pool of aiosqlite connections, opened and warmed at startup."""
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._conns: list[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue[aiosqlite.Connection]] = None
+
+    async def open(self) -> None:
+        self._idle = asyncio.Queue()
+        for _ in range(self._size):
+            conn = await open_db()
+            # Loads the schema so the first real request doesn't pay for it. The cursor must be
+            # closed: an unfinished SELECT pins a stale WAL snapshot and BEGIN IMMEDIATE fails.
+            await fetch_one(conn, "SELECT 1 FROM users LIMIT 1", ())
+            self._conns.append(conn)
+            self._idle.put_nowait(conn)
+
+    async def close(self) -> None:
+        for conn in self._conns:
+            await conn.close()
+        self._conns.clear()
+        self._idle = None
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle.put_nowait(conn)
+
+
+DB_POOL_SIZE = int(os.environ.get("AUTH_DB_POOL_SIZE", "8"))
+db_pool = ConnectionPool(DB_POOL_SIZE)
+
+
+async def db() -> AsyncIterator[aiosqlite.Connection]:
+    async with db_pool.acquire() as conn:
+        yield conn
+
+
+@contextlib.asynccontextmanager
+async def write_transaction(conn: aiosqlite.Connection) -> AsyncIterator[None]:
+    # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers wait out
+    # busy_timeout instead of failing with SQLITE_BUSY on a deferred lock upgrade.
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        await conn.rollback()
+        raise
+    await conn.commit()
+
+
+async def fetch_one(conn: aiosqlite.Connection, sql: str, params: tuple) -> Optional[sqlite3.Row]:
+    async with conn.execute(sql, params) as cursor:
+        return await cursor.fetchone()
+
+
 def init_db() -> None:
-    conn = get_db()
+    conn = sqlite3.connect(DB_FILE)
+    conn.execute("PRAGMA journal_mode=WAL")
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -135,9 +305,9 @@ def init_db() -> None:
     cursor.execute(
         """
         CREATE TABLE IF NOT EXISTS passkey_creds (
-            id TEXT PRIMARY KEY,
+            id BLOB PRIMARY KEY,
             user_id TEXT,
-            public_key TEXT,
+            public_key BLOB,
             sign_count INTEGER,
             transports TEXT,
             device_fingerprint TEXT,
@@ -164,6 +334,9 @@ def init_db() -> None:
         )
     """
     )
+    # Covers both lookups by user_id alone and the (id, user_id) check in login_complete.
+    # users.username and device_bindings are already indexed by their UNIQUE/PRIMARY KEY.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_passkey_user_id_id ON passkey_creds(user_id, id)")
     conn.commit()
     conn.close()
 
@@ -171,10 +344,40 @@ def init_db() -> None:
 init_db()
 
 
-# --- In-Memory Challenge Store ---
-# In production, use Redis or DB with TTL
-registration_challenges: Dict[str, str] = {}  # user_id -> challenge
-authentication_challenges: Dict[str, str] = {}  # user_id -> challenge
+# --- Challenge Store ---
+# Challenges live in Redis so every uvicorn worker sees them and abandoned ones expire.
+class MemoryChallengeStore:
+    """Per-process stand-in for the Redis calls used below; single-worker dev only."""
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, tuple[bytes, float]] = {}
+
+    async def set(self, key: str, value: bytes, ex: int) -> None:
+        self._entries[key] = (value, time.monotonic() + ex)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+# Also carries revoked jtis between workers; None in single-worker in-memory mode.
+redis_client: Optional[redis.Redis] = None
+
+if CHALLENGE_STORE_IN_MEMORY:
+    logger.warning("Using in-memory challenge store; do not run with multiple workers.")
+    challenge_store = MemoryChallengeStore()
+else:
+    redis_client = redis.Redis.from_url(REDIS_URL)
+    challenge_store = redis_client
 
 
 # --- Pydantic Models ---
@@ -214,17 +417,31 @@ class RevokeRequest(BaseModel):
     user_id: str
 
 
+class RevokeTokensRequest(BaseModel):
+    jtis: List[str]
+
+
+class VerifyTokenRequest(BaseModel):
+    token: str
+
+
+class TokenStatusRequest(BaseModel):
+    sub: Optional[str] = None
+    jti: Optional[str] = None
+    iat: Optional[int] = None
+
+
 # --- Helpers ---
 def normalize_username(username: str) -> str:
     return username.strip()
 
 
 def create_user_id() -> str:
-    return base64.urlsafe_b64encode(os.urandom(32)).decode("utf-8").rstrip("=")
+    return token_urlsafe(32)
 
 
 def issue_token(user_id: str, username: str, device_fingerprint: str) -> str:
-    jti = base64.urlsafe_b64encode(os.urandom(16)).decode("utf-8").rstrip("=")
+    jti = token_urlsafe(16)
     now = int(time.time())
     payload = {
         "sub": user_id,
@@ -234,22 +451,152 @@ def issue_token(user_id: str, username: str, device_fingerprint: str) -> str:
         "jti": jti,
         "username": username,
     }
-    return jwt.encode(payload, PRIVATE_KEY_PEM, algorithm="RS256")
+    return jwt.encode(payload, _SIGNING_KEY, algorithm=JWT_ALGORITHM)
 
 
-def bind_device(cursor: sqlite3.Cursor, user_id: str, device_fingerprint: str) -> None:
-    cursor.execute(
-        """
-        INSERT OR IGNORE INTO device_bindings (user_id, device_fingerprint, created_at)
-        VALUES (?, ?, ?)
-    """,
-        (user_id, device_fingerprint, int(time.time())),
+# Validated tokens are cached until their own `exp`, so a reused bearer skips the signature check.
+# Tokens that fail verification are never cached.
+_verified_jwt_cache: TLRUCache = TLRUCache(
+    maxsize=10000,
+    ttu=lambda _token, payload, _now: payload["exp"],
+    timer=time.time,
+)
+
+
+# Every revoked jti is added here, so most verifies rule out revocation without touching SQLite;
+# only filter hits (revoked, or a ~0.1% false positive) are confirmed against revoked_jtis.
+# Each worker loads the filter from SQLite and learns other workers' revocations over Redis
+# pub/sub. While that feed is down the filter may be missing entries, so every check goes to
+# SQLite until it is resubscribed and reloaded.
+revoked_jti_filter = ScalableBloomFilter(initial_capacity=10_000, error_rate=0.001)
+_revoked_filter_complete = False
+
+
+def set_revoked_filter_complete(complete: bool) -> None:
+    global _revoked_filter_complete
+    _revoked_filter_complete = complete
+
+
+async def load_revoked_jtis() -> None:
+    async with db_pool.acquire() as conn:
+        async with conn.execute(SQL_GET_REVOKED_JTIS) as cursor:
+            async for row in cursor:
+                revoked_jti_filter.add(row["jti"])
+
+
+async def follow_revoked_jtis() -> None:
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(REVOKED_JTI_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "subscribe":
+                        # Reload after the subscription is live so nothing revoked in between is missed.
+                        await load_revoked_jtis()
+                        set_revoked_filter_complete(True)
+                    elif message["type"] == "message":
+                        for jti in orjson.loads(message["data"]):
+                            revoked_jti_filter.add(jti)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Revoked jti feed lost; checking revocations against the database")
+        set_revoked_filter_complete(False)
+        await asyncio.sleep(1)
+
+
+async def is_jti_revoked(conn: aiosqlite.Connection, jti: str) -> bool:
+    if _revoked_filter_complete and jti not in revoked_jti_filter:
+        return False
+    return await fetch_one(conn, SQL_IS_JTI_REVOKED, (jti,)) is not None
+
+
+async def is_token_revoked(conn: aiosqlite.Connection, claims: dict) -> bool:
+    # Per-token revocation (/revoke/tokens). Tokens without a jti can't be revoked individually.
+    jti = claims.get("jti")
+    if jti is not None and await is_jti_revoked(conn, jti):
+        return True
+    # User-wide revocation (/revoke) stores a whole-second cutoff; a token issued in that same
+    # second can't be told apart from one issued just before it, so it counts as revoked too.
+    row = await fetch_one(conn, SQL_GET_TOKENS_VALID_AFTER, (claims.get("sub"),))
+    valid_after = (row["tokens_valid_after"] or 0) if row else 0
+    if not valid_after:
+        return False
+    try:
+        return int(claims["iat"]) <= valid_after
+    except (KeyError, TypeError, ValueError):
+        return True
+
+
+async def verify_token(token: str, conn: aiosqlite.Connection) -> dict:
+    """Return the token's claims, raising jwt.InvalidTokenError if it does not verify."""
+    payload = _verified_jwt_cache.get(token)
+    if payload is None:
+        # exp is required: the cache below expires entries by it, and we always issue one.
+        payload = jwt.decode(token, _VERIFY_KEY, algorithms=[JWT_ALGORITHM], options={"require": ["exp"]})
+        _verified_jwt_cache[token] = payload
+    # Checked on cache hits too: a cached token may have been revoked since.
+    if await is_token_revoked(conn, payload):
+        raise jwt.InvalidTokenError("Token has been revoked")
+    return payload
+
+
+def options_response(options_json: bytes, user_id: str) -> Response:
+    # The options are already serialized; splice them in instead of parsing and re-encoding them.
+    body = b'{"options":' + options_json + b',"user_id":' + orjson.dumps(user_id) + b"}"
+    return Response(content=body, media_type="application/json")
+
+
+# Authentication options are identical for every login apart from the challenge, so the
+# library builds them once and login_begin only swaps in a fresh challenge.
+_AUTH_OPTIONS_TEMPLATE: dict = orjson.loads(
+    options_to_json(
+        generate_authentication_options(
+            rp_id=RP_ID,
+            user_verification=UserVerificationRequirement.PREFERRED,
+        )
     )
+)
+
+
+# username -> user_id for the lookup-only endpoints. Users are never renamed or deleted,
+# so an entry can't go stale; only hits are cached, and the upserts refresh it.
+USERNAME_CACHE_MAX = 4096
+_username_cache: OrderedDict[str, str] = OrderedDict()
+
+
+def username_cache_get(username: str) -> Optional[str]:
+    user_id = _username_cache.get(username)
+    if user_id is not None:
+        _username_cache.move_to_end(username)
+    return user_id
+
+
+def username_cache_put(username: str, user_id: str) -> None:
+    _username_cache[username] = user_id
+    _username_cache.move_to_end(username)
+    if len(_username_cache) > USERNAME_CACHE_MAX:
+        _username_cache.popitem(last=False)
+
+
+async def lookup_user_id(conn: aiosqlite.Connection, username: str) -> Optional[str]:
+    user_id = username_cache_get(username)
+    if user_id is None:
+        row = await fetch_one(conn, SQL_GET_USER_BY_NAME, (username,))
+        if row is None:
+            return None
+        user_id = row["id"]
+        username_cache_put(username, user_id)
+    return user_id
+
+
+async def bind_device(conn: aiosqlite.Connection, user_id: str, device_fingerprint: str) -> None:
+    await conn.execute(SQL_BIND_DEVICE, (user_id, device_fingerprint, int(time.time())))
 
 
 # --- Endpoints ---
 @app.get("/health")
-def health() -> dict:
+async def health() -> dict:
     return {
         "status": "ok",
         "rp_id": RP_ID,
@@ -259,36 +606,20 @@ def health() -> dict:
 
 
 @app.get("/public_key")
-def get_public_key() -> dict:
+async def get_public_key() -> dict:
     """Endpoint for server.py to fetch the public key to verify JWTs."""
     return {"public_key": PUBLIC_KEY_PEM.decode("utf-8")}
 
 
 @app.post("/register/begin")
-def register_begin(req: RegisterBeginRequest):
+async def register_begin(req: RegisterBeginRequest, conn: aiosqlite.Connection = Depends(db)):
     username = normalize_username(req.username)
     display_name = req.display_name.strip()
 
-    conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-
-    if row:
-        user_id = row["id"]
-        if display_name:
-            cursor.execute("UPDATE users SET display_name = ? WHERE id = ?", (display_name, user_id))
-            conn.commit()
-    else:
-        user_id = create_user_id()
-        cursor.execute(
-            "INSERT INTO users (id, username, display_name) VALUES (?, ?, ?)",
-            (user_id, username, display_name),
-        )
-        conn.commit()
-
-    conn.close()
+    row = await fetch_one(conn, SQL_UPSERT_USER, (create_user_id(), username, display_name, display_name))
+    await conn.commit()
+    user_id = row["id"]
+    username_cache_put(username, user_id)
 
     options = generate_registration_options(
         rp_id=RP_ID,
@@ -301,14 +632,14 @@ def register_begin(req: RegisterBeginRequest):
         ),
     )
 
-    registration_challenges[user_id] = options.challenge
-    return {"options": json.loads(options_to_json(options)), "user_id": user_id}
+    await challenge_store.set(f"reg:{user_id}", options.challenge, ex=REGISTRATION_CHALLENGE_TTL_SECONDS)
+    return options_response(options_to_json(options).encode(), user_id)
 
 
 @app.post("/register/complete")
-def register_complete(req: RegisterCompleteRequest):
+async def register_complete(req: RegisterCompleteRequest, conn: aiosqlite.Connection = Depends(db)):
     user_id = req.user_id
-    challenge = registration_challenges.get(user_id)
+    challenge = await challenge_store.get(f"reg:{user_id}")
 
     if not challenge:
         raise HTTPException(status_code=400, detail="Challenge not found or expired")
@@ -316,33 +647,27 @@ def register_complete(req: RegisterCompleteRequest):
     try:
         verification = verify_registration_response(
             credential=req.credential,
-            expected_challenge=challenge.encode("utf-8"),
+            expected_challenge=challenge,
             expected_origin=ORIGIN,
             expected_rp_id=RP_ID,
             require_user_verification=False,
         )
 
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO passkey_creds (id, user_id, public_key, sign_count, transports, device_fingerprint)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """,
-            (
-                verification.credential_id.hex(),
-                user_id,
-                verification.credential_public_key.hex(),
-                verification.sign_count,
-                json.dumps([]),
-                req.device_fingerprint,
-            ),
-        )
-        bind_device(cursor, user_id, req.device_fingerprint)
-        conn.commit()
-        conn.close()
-
-        del registration_challenges[user_id]
+        async with write_transaction(conn):
+            await conn.execute(
+                SQL_INSERT_CRED,
+                (
+                    verification.credential_id,
+                    user_id,
+                    verification.credential_public_key,
+                    verification.sign_count,
+                    json.dumps([]),
+                    req.device_fingerprint,
+                ),
+            )
+            await bind_device(conn, user_id, req.device_fingerprint)
+
+        await challenge_store.delete(f"reg:{user_id}")
         return {"status": "ok"}
 
     except Exception as e:
@@ -351,106 +676,80 @@ def register_complete(req: RegisterCompleteRequest):
 
 
 @app.post("/login/begin")
-def login_begin(req: LoginBeginRequest):
+async def login_begin(req: LoginBeginRequest, conn: aiosqlite.Connection = Depends(db)):
     username = normalize_username(req.username)
 
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-    conn.close()
+    user_id = await lookup_user_id(conn, username)
 
-    if not row:
+    if not user_id:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user_id = row["id"]
-
-    options = generate_authentication_options(
-        rp_id=RP_ID,
-        user_verification=UserVerificationRequirement.PREFERRED,
-    )
+    challenge = generate_challenge()
+    options = dict(_AUTH_OPTIONS_TEMPLATE, challenge=bytes_to_base64url(challenge))
 
-    authentication_challenges[user_id] = options.challenge
-    return {"options": json.loads(options_to_json(options)), "user_id": user_id}
+    await challenge_store.set(f"auth:{user_id}", challenge, ex=AUTHENTICATION_CHALLENGE_TTL_SECONDS)
+    return options_response(orjson.dumps(options), user_id)
 
 
 @app.post("/login/complete")
-def login_complete(req: LoginCompleteRequest):
+async def login_complete(req: LoginCompleteRequest, conn: aiosqlite.Connection = Depends(db)):
     username = normalize_username(req.username)
 
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-    user_row = cursor.fetchone()
-
-    if not user_row:
-        conn.close()
-        raise HTTPException(status_code=404, detail="User not found")
-
-    user_id = user_row["id"]
-    challenge = authentication_challenges.get(user_id)
-
-    if not challenge:
-        conn.close()
-        raise HTTPException(status_code=400, detail="Challenge not found or expired")
-
-    client_credential_id = req.credential.get("id")
+    try:
+        # Credential ids are stored as raw bytes; the client sends them base64url-encoded.
+        client_credential_id = base64url_to_bytes(req.credential.get("id") or "")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed credential id")
 
-    cursor.execute(
-        "SELECT public_key, sign_count, device_fingerprint FROM passkey_creds WHERE id = ? AND user_id = ?",
-        (client_credential_id, user_id),
-    )
-    cred_row = cursor.fetchone()
+    cred_row = await fetch_one(conn, SQL_GET_LOGIN_CRED, (username, client_credential_id, req.device_fingerprint))
 
     if not cred_row:
-        conn.close()
-        raise HTTPException(status_code=401, detail="Credential not registered for this user")
-
-    db_device_fingerprint = cred_row["device_fingerprint"]
-    if db_device_fingerprint != req.device_fingerprint:
-        conn.close()
+        failure_row = await fetch_one(conn, SQL_GET_LOGIN_FAILURE, (client_credential_id, username))
+        if not failure_row:
+            raise HTTPException(status_code=404, detail="User not found")
+        if failure_row["device_fingerprint"] is None:
+            raise HTTPException(status_code=401, detail="Credential not registered for this user")
         logger.warning(
             "Device fingerprint mismatch for user %s. Expected %s, got %s",
-            user_id,
-            db_device_fingerprint,
+            failure_row["id"],
+            failure_row["device_fingerprint"],
             req.device_fingerprint,
         )
         raise HTTPException(status_code=403, detail="Device verification failed. Please register this device.")
 
-    try:
-        public_key_bytes = bytes.fromhex(cred_row["public_key"])
+    user_id = cred_row["id"]
+    challenge = await challenge_store.get(f"auth:{user_id}")
 
+    if not challenge:
+        raise HTTPException(status_code=400, detail="Challenge not found or expired")
+
+    try:
         verification = verify_authentication_response(
             credential=req.credential,
-            expected_challenge=challenge.encode("utf-8"),
+            expected_challenge=challenge,
             expected_origin=ORIGIN,
             expected_rp_id=RP_ID,
-            credential_public_key=public_key_bytes,
+            credential_public_key=cred_row["public_key"],
             credential_current_sign_count=cred_row["sign_count"],
             require_user_verification=False,
         )
 
-        cursor.execute(
-            "UPDATE passkey_creds SET sign_count = ? WHERE id = ?",
-            (verification.new_sign_count, client_credential_id),
-        )
-        bind_device(cursor, user_id, req.device_fingerprint)
-        conn.commit()
-        conn.close()
+        async with write_transaction(conn):
+            await conn.execute(SQL_UPDATE_SIGNCOUNT, (verification.new_sign_count, client_credential_id))
+            await bind_device(conn, user_id, req.device_fingerprint)
 
-        del authentication_challenges[user_id]
+        await challenge_store.delete(f"auth:{user_id}")
 
         token = issue_token(user_id=user_id, username=username, device_fingerprint=req.device_fingerprint)
         return {"token": token}
 
     except Exception as e:
-        conn.close()
         logger.error("Login failed: %s", e)
         raise HTTPException(status_code=401, detail=str(e))
 
 
 @app.post("/dev/session/register")
-def dev_register(req: DevRegisterRequest):
+async def dev_register(req: DevRegisterRequest, conn: aiosqlite.Connection = Depends(db)):
     if not ENABLE_DEV_AUTH_FALLBACK:
         raise HTTPException(status_code=404, detail="Not found")
 
@@ -461,33 +760,22 @@ def dev_register(req: DevRegisterRequest):
     if not username or not device_fingerprint:
         raise HTTPException(status_code=400, detail="username and device_fingerprint are required")
 
-    conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-
-    if row:
-        user_id = row["id"]
-        if display_name:
-            cursor.execute("UPDATE users SET display_name = ? WHERE id = ?", (display_name, user_id))
-    else:
-        user_id = create_user_id()
-        cursor.execute(
-            "INSERT INTO users (id, username, display_name) VALUES (?, ?, ?)",
-            (user_id, username, display_name or username),
+    async with write_transaction(conn):
+        row = await fetch_one(
+            conn,
+            SQL_UPSERT_USER,
+            (create_user_id(), username, display_name or username, display_name),
         )
-
-    bind_device(cursor, user_id, device_fingerprint)
-    conn.commit()
-    conn.close()
+        user_id = row["id"]
+        await bind_device(conn, user_id, device_fingerprint)
+    username_cache_put(username, user_id)
 
     logger.warning("DEV fallback registration used for username=%s", username)
     return {"status": "ok", "mode": "dev_fallback"}
 
 
 @app.post("/dev/session/login")
-def dev_login(req: DevLoginRequest):
+async def dev_login(req: DevLoginRequest, conn: aiosqlite.Connection = Depends(db)):
     if not ENABLE_DEV_AUTH_FALLBACK:
         raise HTTPException(status_code=404, detail="Not found")
 
@@ -497,22 +785,11 @@ def dev_login(req: DevLoginRequest):
     if not username or not device_fingerprint:
         raise HTTPException(status_code=400, detail="username and device_fingerprint are required")
 
-    conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-    if not row:
-        conn.close()
+    user_id = await lookup_user_id(conn, username)
+    if not user_id:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user_id = row["id"]
-    cursor.execute(
-        "SELECT 1 FROM device_bindings WHERE user_id = ? AND device_fingerprint = ?",
-        (user_id, device_fingerprint),
-    )
-    binding = cursor.fetchone()
-    conn.close()
+    binding = await fetch_one(conn, SQL_GET_DEVICE_BINDING, (user_id, device_fingerprint))
 
     if not binding:
         raise HTTPException(status_code=403, detail="Device not registered. Please register this device first.")
@@ -523,27 +800,47 @@ def dev_login(req: DevLoginRequest):
 
 
 @app.post("/revoke")
-def revoke_tokens(req: RevokeRequest):
-    conn = get_db()
-    cursor = conn.cursor()
-
+async def revoke_tokens(req: RevokeRequest, conn: aiosqlite.Connection = Depends(db)):
     now = int(time.time())
-    cursor.execute("UPDATE users SET tokens_valid_after = ? WHERE id = ?", (now, req.user_id))
-    conn.commit()
-    conn.close()
+    async with write_transaction(conn):
+        await conn.execute(SQL_REVOKE_USER_TOKENS, (now, req.user_id))
 
     return {"status": "User sessions revoked"}
 
 
+@app.post("/revoke/tokens")
+async def revoke_token_ids(req: RevokeTokensRequest, conn: aiosqlite.Connection = Depends(db)):
+    now = int(time.time())
+    async with write_transaction(conn):
+        await conn.executemany(SQL_REVOKE_JTI, [(jti, now) for jti in req.jtis])
+    for jti in req.jtis:
+        revoked_jti_filter.add(jti)
+    if redis_client is not None:
+        await redis_client.publish(REVOKED_JTI_CHANNEL, orjson.dumps(req.jtis))
+
+    return {"status": "Tokens revoked", "count": len(req.jtis)}
+
+
+@app.post("/token/verify")
+async def verify_session_token(req: VerifyTokenRequest, conn: aiosqlite.Connection = Depends(db)):
+    try:
+        return await verify_token(req.token, conn)
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid or revoked token")
+
+
+# Used by the signaling server, which has already verified the signature, to reject revoked
+# tokens at connect time without a second signature check here.
+@app.post("/token/status")
+async def token_status(req: TokenStatusRequest, conn: aiosqlite.Connection = Depends(db)):
+    return {"revoked": await is_token_revoked(conn, req.model_dump(exclude_none=True))}
+
+
 @app.get("/user/{username}")
-def get_user_id(username: str):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        return {"user_id": row["id"]}
+async def get_user_id(username: str, conn: aiosqlite.Connection = Depends(db)):
+    user_id = await lookup_user_id(conn, username)
+    if user_id:
+        return {"user_id": user_id}
     raise HTTPException(status_code=404, detail="Not found")
 
 
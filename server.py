@@ -1,68 +1,278 @@
 import argparse
 import asyncio
+import binascii
 import contextlib
+import hashlib
+import heapq
+import itertools
 import json
 import logging
+import os
 import signal
 import time
-from collections import deque
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Dict, Optional, Any
-from urllib.parse import parse_qs, urlparse
-import urllib.request
+from typing import Dict, Optional, Any, Union
+from urllib.parse import unquote_plus
 
+import aiohttp
 import jwt
+from jwt.algorithms import OKPAlgorithm
+from jwt.exceptions import InvalidJTIError, InvalidSubjectError
+from jwt.utils import base64url_decode
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
 from websockets.asyncio.server import ServerConnection, serve
 from websockets.exceptions import ConnectionClosed
 
+try:
+    import uvloop
+except ImportError:  # e.g. Windows dev machines; fall back to the default asyncio loop.
+    uvloop = None
+
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
 AUTH_SERVER_URL = "http://127.0.0.1:8081"
 PUBLIC_KEY_PEM: Optional[str] = None
+# Parsed once per fetched PEM so jwt.decode doesn't re-deserialize it on every verify.
+PUBLIC_KEY_OBJ: Optional[Ed25519PublicKey] = None
 PUBLIC_KEY_LAST_FETCHED_AT = 0.0
 PUBLIC_KEY_CACHE_TTL_SECONDS = 60
+# The refresh currently in flight; concurrent callers await it instead of fetching again,
+# whether it succeeds or fails.
+_public_key_refresh: Optional[asyncio.Task] = None
+_http_session: Optional[aiohttp.ClientSession] = None
 
 
-def fetch_public_key(force_refresh: bool = False) -> str:
-    global PUBLIC_KEY_PEM, PUBLIC_KEY_LAST_FETCHED_AT
-    now = time.time()
-    cache_is_fresh = PUBLIC_KEY_PEM and (now - PUBLIC_KEY_LAST_FETCHED_AT) < PUBLIC_KEY_CACHE_TTL_SECONDS
-    if not force_refresh and cache_is_fresh:
-        return PUBLIC_KEY_PEM
+def get_http_session() -> aiohttp.ClientSession:
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+    return _http_session
+
+
+async def close_http_session() -> None:
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+
+
+async def _refresh_public_key() -> Optional[Ed25519PublicKey]:
+    global PUBLIC_KEY_PEM, PUBLIC_KEY_OBJ, PUBLIC_KEY_LAST_FETCHED_AT
     try:
-        req = urllib.request.Request(f"{AUTH_SERVER_URL}/public_key")
-        with urllib.request.urlopen(req, timeout=5) as response:
-            data = json.loads(response.read().decode())
-            PUBLIC_KEY_PEM = data.get("public_key")
-            PUBLIC_KEY_LAST_FETCHED_AT = now
-            return PUBLIC_KEY_PEM
+        async with get_http_session().get(f"{AUTH_SERVER_URL}/public_key") as response:
+            # Unlike urlopen, aiohttp doesn't raise on 4xx/5xx by itself.
+            response.raise_for_status()
+            data = json.loads(await response.read())
+        pem = data.get("public_key") if isinstance(data, dict) else None
+        if not isinstance(pem, str):
+            raise ValueError("response has no public_key string")
+        if pem != PUBLIC_KEY_PEM or PUBLIC_KEY_OBJ is None:
+            PUBLIC_KEY_OBJ = serialization.load_pem_public_key(pem.encode())
+            PUBLIC_KEY_PEM = pem
+        PUBLIC_KEY_LAST_FETCHED_AT = time.time()
+        return PUBLIC_KEY_OBJ
     except Exception as e:
         logger.error(f"Failed to fetch public key from auth server: {e}")
-        return ""
+        return None
+
+
+def _clear_public_key_refresh(task: asyncio.Task) -> None:
+    global _public_key_refresh
+    if _public_key_refresh is task:
+        _public_key_refresh = None
+
 
-def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
-    pub_key = fetch_public_key()
+async def fetch_public_key(force_refresh: bool = False) -> Optional[Ed25519PublicKey]:
+    global _public_key_refresh
+    cache_is_fresh = PUBLIC_KEY_OBJ and (time.time() - PUBLIC_KEY_LAST_FETCHED_AT) < PUBLIC_KEY_CACHE_TTL_SECONDS
+    if not force_refresh and cache_is_fresh:
+        return PUBLIC_KEY_OBJ
+    if _public_key_refresh is None:
+        _public_key_refresh = asyncio.create_task(_refresh_public_key())
+        _public_key_refresh.add_done_callback(_clear_public_key_refresh)
+    # Shielded so one handshake being cancelled doesn't cancel the fetch the others are waiting on.
+    return await asyncio.shield(_public_key_refresh)
+
+async def is_token_active(claims: Dict[str, Any]) -> bool:
+    # Revocation lives on the auth server (per-token /revoke/tokens and user-wide /revoke). The
+    # signature is already verified here, so only the claims it needs are sent, not the token.
+    # Fails closed: if the auth server can't answer, the token is refused.
+    body = {"sub": claims.get("sub"), "jti": claims.get("jti"), "iat": _claim_int(claims, "iat")}
+    try:
+        async with get_http_session().post(f"{AUTH_SERVER_URL}/token/status", json=body) as response:
+            response.raise_for_status()
+            data = json.loads(await response.read())
+        if data.get("revoked") is not False:
+            logger.warning("JWT rejected by auth server")
+            return False
+        return True
+    except Exception as e:
+        logger.error(f"Failed to check token with auth server: {e}")
+        return False
+
+# Verified payloads keyed by sha256(token), so reconnects within a token's lifetime skip the
+# signature check and the auth server round-trip, which bounds how long a revoked token can
+# still connect to JWT_CACHE_TTL. The raw token is never stored; failures are never cached.
+JWT_CACHE_MAX = 10_000
+JWT_CACHE_TTL = 5
+_jwt_cache: "OrderedDict[bytes, tuple[Dict[str, Any], float]]" = OrderedDict()
+
+
+async def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    cache_key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    cached = _jwt_cache.get(cache_key)
+    if cached is not None:
+        payload, expires_at = cached
+        if expires_at > now:
+            _jwt_cache.move_to_end(cache_key)
+            return payload
+        del _jwt_cache[cache_key]
+
+    payload = await _decode_jwt(token)
+    if payload is not None and not await is_token_active(payload):
+        payload = None
+    if payload is not None:
+        # exp may legally be any int-like value (e.g. "1700000000"), as PyJWT accepts it.
+        expires_at = now + JWT_CACHE_TTL
+        if "exp" in payload:
+            expires_at = min(int(payload["exp"]), expires_at)
+        _jwt_cache[cache_key] = (payload, expires_at)
+        while len(_jwt_cache) > JWT_CACHE_MAX:
+            _jwt_cache.popitem(last=False)
+    return payload
+
+
+# Cold-path signature checks run off the event loop; cryptography releases the GIL while verifying.
+_verify_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="jwt-verify")
+
+
+# The auth server only issues EdDSA tokens with sub/username/device/iat/exp/jti claims, so the
+# common case is verified directly with a single pre-built algorithm instead of PyJWT's full
+# decode. Checks and exceptions mirror jwt.decode(token, key, algorithms=["EdDSA"]).
+_EDDSA = OKPAlgorithm()
+_FAST_PATH_HEADER_KEYS = {"alg", "typ"}
+_BASE64URL_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+def _b64url_segment(segment: str, name: str) -> bytes:
+    # Same strictness as PyJWT: optional trailing '=' padding, nothing outside the alphabet.
+    stripped = segment.rstrip("=")
+    padding = len(segment) - len(stripped)
+    if (
+        padding > 2
+        or (padding and len(segment) % 4)
+        or len(stripped) % 4 == 1
+        or not _BASE64URL_CHARS.issuperset(stripped)
+    ):
+        raise jwt.DecodeError(f"Invalid {name} padding")
+    try:
+        return base64url_decode(stripped)
+    except (TypeError, binascii.Error) as e:
+        raise jwt.DecodeError(f"Invalid {name} padding") from e
+
+
+def _claim_int(payload: Dict[str, Any], claim: str) -> Optional[int]:
+    if claim not in payload:
+        return None
+    try:
+        return int(payload[claim])
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _jwt_decode_sync(token: str, key: Ed25519PublicKey) -> Dict[str, Any]:
+    try:
+        signing_input, signature_segment = token.rsplit(".", 1)
+        header_segment, payload_segment = signing_input.split(".", 1)
+    except ValueError as e:
+        raise jwt.DecodeError("Not enough segments") from e
+
+    header_bytes = _b64url_segment(header_segment, "header")
+    try:
+        header = json.loads(header_bytes)
+    except (ValueError, RecursionError) as e:
+        raise jwt.DecodeError(f"Invalid header string: {e}") from e
+    if not isinstance(header, dict):
+        raise jwt.DecodeError("Invalid header string: must be a json object")
+
+    # Anything beyond what we issue (kid, crit, b64, ...) gets PyJWT's full validation.
+    if not header.keys() <= _FAST_PATH_HEADER_KEYS:
+        return jwt.decode(token, key, algorithms=["EdDSA"])
+
+    payload_bytes = _b64url_segment(payload_segment, "payload")
+    signature = _b64url_segment(signature_segment, "crypto")
+    if "alg" not in header:
+        raise jwt.InvalidAlgorithmError("Algorithm not specified")
+    if header["alg"] != "EdDSA":
+        raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+    if not _EDDSA.verify(signing_input.encode(), key, signature):
+        raise jwt.InvalidSignatureError("Signature verification failed")
+
+    try:
+        payload = json.loads(payload_bytes)
+    except (ValueError, RecursionError) as e:
+        raise jwt.DecodeError(f"Invalid payload string: {e}") from e
+    if not isinstance(payload, dict):
+        raise jwt.DecodeError("Invalid payload string: must be a json object")
+
+    # Claims we don't issue are left to PyJWT as well.
+    if "nbf" in payload or "aud" in payload:
+        return jwt.decode(token, key, algorithms=["EdDSA"])
+
+    now = time.time()
+    if "iat" in payload:
+        iat = _claim_int(payload, "iat")
+        if iat is None:
+            raise jwt.InvalidIssuedAtError("Issued At claim (iat) must be an integer.")
+        if iat > now:
+            raise jwt.ImmatureSignatureError("The token is not yet valid (iat)")
+    if "exp" in payload:
+        exp = _claim_int(payload, "exp")
+        if exp is None:
+            raise jwt.DecodeError("Expiration Time claim (exp) must be an integer.")
+        if exp <= now:
+            raise jwt.ExpiredSignatureError("Signature has expired")
+    if "sub" in payload and not isinstance(payload["sub"], str):
+        raise InvalidSubjectError("Subject must be a string")
+    if "jti" in payload and not isinstance(payload["jti"], str):
+        raise InvalidJTIError("JWT ID must be a string")
+    return payload
+
+
+async def _verify_in_pool(token: str, key: Ed25519PublicKey) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_verify_pool, _jwt_decode_sync, token, key)
+
+
+async def _decode_jwt(token: str) -> Optional[Dict[str, Any]]:
+    pub_key = await fetch_public_key()
     if not pub_key:
         return None
         
     try:
         # We explicitly decode with the public key we fetched
-        payload = jwt.decode(token, pub_key, algorithms=["RS256"])
-        
-        # Additionally, verify if the user's tokens haven't been blanket revoked
-        # We need another endpoint on auth server or sqlite db access. Since they 
-        # run on the same machine we could fetch it via http.
-        # For simplicity, if jwt decode succeeds (checks expiry), it's nominally fine.
-        return payload
+        # Only signature and claims are checked here; per-token and user-wide ("blanket")
+        # revocation are checked against the auth server by is_token_active afterwards.
+        return await _verify_in_pool(token, pub_key)
     except jwt.ExpiredSignatureError:
         logger.warning("JWT expired")
         return None
     except jwt.InvalidTokenError as e:
         logger.warning(f"JWT invalid: {e}")
         # Auth server may have rotated/restarted; refresh key and retry once.
-        refreshed_key = fetch_public_key(force_refresh=True)
-        if refreshed_key and refreshed_key != pub_key:
+        refreshed_key = await fetch_public_key(force_refresh=True)
+        if refreshed_key and refreshed_key is not pub_key:
             try:
-                return jwt.decode(token, refreshed_key, algorithms=["RS256"])
+                return await _verify_in_pool(token, refreshed_key)
             except jwt.ExpiredSignatureError:
                 logger.warning("JWT expired after refresh")
                 return None
@@ -73,41 +283,97 @@ def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
 
 MAX_PARTICIPANTS_PER_ROOM = 4
 MAX_MESSAGES_PER_SECOND = 50
+RATE_LIMIT_SLOTS = 10
 ROOM_IDLE_EXPIRY_SECONDS = 2 * 60 * 60
 PEER_LEFT_TYPE = "peer_left"
 ERROR_TYPE = "error"
 PEER_JOINED_TYPE = "peer_joined"
 
 
+def _error_frame(code: str, message: str) -> bytes:
+    return _dumps({"type": ERROR_TYPE, "payload": {"code": code, "message": message}})
+
+
+# Fixed error replies, serialized once instead of on every rejection.
+BAD_REQUEST_MSG = _error_frame("bad_request", "Query requires room, clientId, and token.")
+AUTH_FAILED_MSG = _error_frame("auth_failed", "Invalid or expired session token.")
+ROOM_FULL_MSG = _error_frame("room_full", f"Room has reached max capacity ({MAX_PARTICIPANTS_PER_ROOM}).")
+RATE_LIMITED_MSG = _error_frame("rate_limited", "Max 10 messages/sec.")
+
+
+def _peer_event_template(event_type: str) -> bytes:
+    # Fixed envelope with %b slots for the JSON-encoded peerId and ts.
+    return b'{"type":%b,"senderId":"server","targetId":"*","payload":{"peerId":%%b,"ts":%%b}}' % _dumps(event_type)
+
+
+_PEER_JOINED_TMPL = _peer_event_template(PEER_JOINED_TYPE)
+_PEER_LEFT_TMPL = _peer_event_template(PEER_LEFT_TYPE)
+
+
 class RoomFullError(Exception):
     pass
 
 
+# Formatted timestamps shared by broadcasts and log lines, refreshed by refresh_timestamps().
+TIMESTAMP_REFRESH_SECONDS = 0.5
+_cached_utc_iso = ""
+_cached_compact = ""
+
+
+def _update_timestamps() -> None:
+    global _cached_utc_iso, _cached_compact
+    now = datetime.now(timezone.utc)
+    _cached_utc_iso = now.isoformat()
+    _cached_compact = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+_update_timestamps()
+
+
+async def refresh_timestamps(stop_event: asyncio.Event) -> None:
+    while not stop_event.is_set():
+        await asyncio.sleep(TIMESTAMP_REFRESH_SECONDS)
+        _update_timestamps()
+
+
 def utc_ts() -> str:
-    return datetime.now(timezone.utc).isoformat()
+    return _cached_utc_iso
 
 
 def compact_now() -> str:
-    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return _cached_compact
+
+
+_room_generations = itertools.count()
 
 
 @dataclass
 class Room:
-    clients: Dict[ServerConnection, str] = field(default_factory=dict)
-    last_active: float = field(default_factory=time.time)
+    # (connection, client_id) pairs; never more than MAX_PARTICIPANTS_PER_ROOM entries.
+    clients: list[tuple[ServerConnection, str]] = field(default_factory=list)
+    last_active: float = field(default_factory=time.monotonic)
+    # Unique per Room instance, so an idle-heap entry can tell a recreated room from the one it was pushed for.
+    generation: int = field(default_factory=_room_generations.__next__)
 
 
 @dataclass
 class ClientState:
     room_code: str
     client_id: str
-    # Sliding 1-second window of message timestamps for rate limiting.
-    message_times: deque = field(default_factory=deque)
+    # 1-second rate-limit window as a ring of 100ms buckets: per-slot counts and the
+    # absolute bucket index each slot currently holds.
+    slot_counts: list[int] = field(default_factory=lambda: [0] * RATE_LIMIT_SLOTS)
+    slot_ids: list[int] = field(default_factory=lambda: [-1] * RATE_LIMIT_SLOTS)
+    # Other connections in the same room, maintained on join/leave so fan-out needs no filtering.
+    peers: list[ServerConnection] = field(default_factory=list)
 
 
 rooms: Dict[str, Room] = {}
 client_states: Dict[ServerConnection, ClientState] = {}
-rooms_lock = asyncio.Lock()
+# Min-heap of (deadline, room generation, room_code), one entry per room. Entries are checked
+# lazily when they come due: deleted rooms are dropped, rooms touched since are re-pushed.
+# Rooms deleted by their last client leaving leave a stale entry behind until the heap is compacted.
+_idle_heap: list[tuple[float, int, str]] = []
 logger = logging.getLogger("signaling")
 
 
@@ -129,9 +395,9 @@ def sanitize_client_id(raw: Optional[str]) -> Optional[str]:
     return client_id
 
 
-async def safe_send(connection: ServerConnection, payload: str) -> None:
+async def safe_send(connection: ServerConnection, payload: Union[str, bytes], text: Optional[bool] = None) -> None:
     try:
-        await connection.send(payload)
+        await connection.send(payload, text=text)
     except ConnectionClosed:
         return
     except Exception:
@@ -139,99 +405,107 @@ async def safe_send(connection: ServerConnection, payload: str) -> None:
 
 
 async def send_json(connection: ServerConnection, obj: dict) -> None:
-    await safe_send(connection, json.dumps(obj, separators=(",", ":")))
+    await safe_send(connection, _dumps(obj), text=True)
 
 
-def parse_query(path: str) -> tuple[Optional[str], Optional[str], Optional[str]]:
-    parsed = urlparse(path)
-    q = parse_qs(parsed.query)
-    room = sanitize_room_code((q.get("room") or [None])[0])
-    client_id = sanitize_client_id((q.get("clientId") or [None])[0])
-    token = (q.get("token") or [None])[0]
-    return room, client_id, token
+def _query_value(raw: str) -> Optional[str]:
+    if not raw:
+        return None
+    # Room codes, client ids and JWTs are normally URL-safe; only decode when needed.
+    if "%" in raw or "+" in raw:
+        return unquote_plus(raw)
+    return raw
 
 
-async def notify_peer_joined(room_code: str, joined_client: ServerConnection, joined_client_id: str) -> None:
-    room = rooms.get(room_code)
-    if not room:
+def parse_query(path: str) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    # Hand-rolled split of "/?room=..&clientId=..&token=..": the first non-empty value of
+    # each key wins, matching what parse_qs gave us without its generic URL handling.
+    room = client_id = token = None
+    q_idx = path.find("?")
+    if q_idx != -1:
+        for pair in path[q_idx + 1:].split("&"):
+            key, _, value = pair.partition("=")
+            if key == "room":
+                if room is None:
+                    room = _query_value(value)
+            elif key == "clientId":
+                if client_id is None:
+                    client_id = _query_value(value)
+            elif key == "token":
+                if token is None:
+                    token = _query_value(value)
+    return sanitize_room_code(room), sanitize_client_id(client_id), token
+
+
+async def notify_peer_joined(state: ClientState) -> None:
+    if not state.peers:
         return
-    payload = {
-        "type": PEER_JOINED_TYPE,
-        "senderId": "server",
-        "targetId": "*",
-        "payload": {"peerId": joined_client_id, "ts": utc_ts()},
-    }
-    encoded = json.dumps(payload, separators=(",", ":"))
-    for peer in list(room.clients.keys()):
-        if peer is joined_client:
-            continue
-        await safe_send(peer, encoded)
+    # Encoded once and sent as TEXT (clients expect text frames) without per-peer re-encoding.
+    encoded = _PEER_JOINED_TMPL % (_dumps(state.client_id), _dumps(utc_ts()))
+    await asyncio.gather(
+        *(safe_send(peer, encoded, text=True) for peer in state.peers),
+        return_exceptions=True,
+    )
 
 
 async def handle_join(connection: ServerConnection, room_code: str, client_id: str) -> None:
-    async with rooms_lock:
-        room = rooms.get(room_code)
-        if room is None:
-            room = Room()
-            rooms[room_code] = room
-
-        if len(room.clients) >= MAX_PARTICIPANTS_PER_ROOM:
-            await send_json(
-                connection,
-                {
-                    "type": ERROR_TYPE,
-                    "payload": {"code": "room_full", "message": "Room has reached max capacity (4)."},
-                },
-            )
-            raise RoomFullError("room_full")
-
-        room.clients[connection] = client_id
-        room.last_active = time.time()
-        client_states[connection] = ClientState(room_code=room_code, client_id=client_id)
+    # Room bookkeeping relies on the single-event-loop invariant: no await between reading
+    # and mutating rooms/client_states, so no lock is needed.
+    room = rooms.get(room_code)
+    if room is None:
+        room = Room()
+        rooms[room_code] = room
+        heapq.heappush(_idle_heap, (room.last_active + ROOM_IDLE_EXPIRY_SECONDS, room.generation, room_code))
+
+    if len(room.clients) >= MAX_PARTICIPANTS_PER_ROOM:
+        await safe_send(connection, ROOM_FULL_MSG, text=True)
+        raise RoomFullError("room_full")
+
+    state = ClientState(room_code=room_code, client_id=client_id)
+    for peer, _ in room.clients:
+        state.peers.append(peer)
+        client_states[peer].peers.append(connection)
+    room.clients.append((connection, client_id))
+    room.last_active = time.monotonic()
+    client_states[connection] = state
 
     logger.info("event=join room=%s ts=%s", room_code, compact_now())
-    await notify_peer_joined(room_code, connection, client_id)
+    await notify_peer_joined(state)
 
 
 def over_rate_limit(state: ClientState) -> bool:
-    now = time.time()
-    while state.message_times and now - state.message_times[0] > 1:
-        state.message_times.popleft()
-    if len(state.message_times) >= MAX_MESSAGES_PER_SECOND:
+    bucket = int(time.monotonic() * RATE_LIMIT_SLOTS)
+    slot = bucket % RATE_LIMIT_SLOTS
+    counts = state.slot_counts
+    ids = state.slot_ids
+    if ids[slot] != bucket:
+        ids[slot] = bucket
+        counts[slot] = 0
+    oldest = bucket - RATE_LIMIT_SLOTS + 1
+    total = 0
+    for i in range(RATE_LIMIT_SLOTS):
+        if ids[i] >= oldest:
+            total += counts[i]
+    if total >= MAX_MESSAGES_PER_SECOND:
         return True
-    state.message_times.append(now)
+    counts[slot] += 1
     return False
 
 
-async def relay_to_room(connection: ServerConnection, message: str) -> None:
-    state = client_states.get(connection)
-    if not state:
-        return
-    room = rooms.get(state.room_code)
-    if not room:
+async def relay_to_room(state: ClientState, room: Room, message: Union[str, bytes]) -> None:
+    room.last_active = time.monotonic()
+    if not state.peers:
         return
 
-    room.last_active = time.time()
-    targets = [peer for peer in room.clients.keys() if peer is not connection]
-    if not targets:
-        return
-
-    await asyncio.gather(*(safe_send(peer, message) for peer in targets))
+    await asyncio.gather(*(safe_send(peer, message) for peer in state.peers))
 
 
-async def notify_peer_left(room_code: str, departed_client_id: str, departed_connection: ServerConnection) -> None:
-    room = rooms.get(room_code)
-    if not room:
+async def notify_peer_left(state: ClientState) -> None:
+    if not state.peers:
         return
-    payload = {
-        "type": PEER_LEFT_TYPE,
-        "senderId": "server",
-        "targetId": "*",
-        "payload": {"peerId": departed_client_id, "ts": utc_ts()},
-    }
-    encoded = json.dumps(payload, separators=(",", ":"))
+    encoded = _PEER_LEFT_TMPL % (_dumps(state.client_id), _dumps(utc_ts()))
     await asyncio.gather(
-        *(safe_send(peer, encoded) for peer in room.clients.keys() if peer is not departed_connection),
+        *(safe_send(peer, encoded, text=True) for peer in state.peers),
         return_exceptions=True,
     )
 
@@ -242,44 +516,70 @@ async def remove_client(connection: ServerConnection) -> None:
         return
 
     room_code = state.room_code
-    async with rooms_lock:
-        room = rooms.get(room_code)
-        if not room:
-            return
-        room.clients.pop(connection, None)
-        room.last_active = time.time()
-        empty = not room.clients
-        if empty:
-            rooms.pop(room_code, None)
+    room = rooms.get(room_code)
+    if not room:
+        return
+    room.clients = [entry for entry in room.clients if entry[0] is not connection]
+    for peer in state.peers:
+        peer_state = client_states.get(peer)
+        if peer_state:
+            peer_state.peers.remove(connection)
+    room.last_active = time.monotonic()
+    empty = not room.clients
+    if empty:
+        rooms.pop(room_code, None)
+        if len(_idle_heap) > 2 * len(rooms):
+            compact_idle_heap()
 
     if empty:
         logger.info("event=room_deleted room=%s ts=%s", room_code, compact_now())
     else:
         logger.info("event=leave room=%s ts=%s", room_code, compact_now())
-        await notify_peer_left(room_code, state.client_id, connection)
+        await notify_peer_left(state)
+
+
+def is_live_idle_entry(entry: tuple[float, int, str]) -> bool:
+    room = rooms.get(entry[2])
+    return room is not None and room.generation == entry[1]
+
+
+def compact_idle_heap() -> None:
+    # Drop entries for rooms that no longer exist so short-lived rooms can't grow the heap without bound.
+    _idle_heap[:] = [entry for entry in _idle_heap if is_live_idle_entry(entry)]
+    heapq.heapify(_idle_heap)
 
 
 async def cleanup_idle_rooms(stop_event: asyncio.Event) -> None:
     while not stop_event.is_set():
-        await asyncio.sleep(60)
-        now = time.time()
-        to_drop: list[tuple[str, list[ServerConnection]]] = []
-        async with rooms_lock:
-            for room_code, room in list(rooms.items()):
-                if now - room.last_active > ROOM_IDLE_EXPIRY_SECONDS:
-                    stale_connections = list(room.clients.keys())
-                    to_drop.append((room_code, stale_connections))
-                    for conn in stale_connections:
-                        client_states.pop(conn, None)
-            for room_code, _ in to_drop:
-                rooms.pop(room_code, None)
-
-        for room_code, stale_connections in to_drop:
-            if stale_connections:
-                await asyncio.gather(
-                    *(conn.close(code=4000, reason="room_idle_expired") for conn in stale_connections),
-                    return_exceptions=True,
-                )
+        # New entries are always due later than the current head, so sleeping until the head
+        # comes due never misses an expiry.
+        delay = _idle_heap[0][0] - time.monotonic() if _idle_heap else 60
+        await asyncio.sleep(max(delay, 1))
+        now = time.monotonic()
+        expired: list[str] = []
+        stale_connections: list[ServerConnection] = []
+        while _idle_heap and _idle_heap[0][0] <= now:
+            entry = heapq.heappop(_idle_heap)
+            if not is_live_idle_entry(entry):
+                continue
+            _, generation, room_code = entry
+            room = rooms[room_code]
+            deadline = room.last_active + ROOM_IDLE_EXPIRY_SECONDS
+            if deadline > now:
+                heapq.heappush(_idle_heap, (deadline, generation, room_code))
+                continue
+            rooms.pop(room_code, None)
+            expired.append(room_code)
+            for conn, _ in room.clients:
+                client_states.pop(conn, None)
+                stale_connections.append(conn)
+
+        if stale_connections:
+            await asyncio.gather(
+                *(conn.close(code=4000, reason="room_idle_expired") for conn in stale_connections),
+                return_exceptions=True,
+            )
+        for room_code in expired:
             logger.info("room_deleted room=%s ts=%s reason=idle_expiry", room_code, compact_now())
 
 
@@ -288,19 +588,13 @@ async def handle_connection(connection: ServerConnection) -> None:
     room_code, client_id, token = parse_query(request.path)
     
     if room_code is None or client_id is None or token is None:
-        await send_json(
-            connection,
-            {"type": ERROR_TYPE, "payload": {"code": "bad_request", "message": "Query requires room, clientId, and token."}},
-        )
+        await safe_send(connection, BAD_REQUEST_MSG, text=True)
         await connection.close(code=4001, reason="missing_room_or_client_or_token")
         return
 
-    payload = verify_jwt(token)
+    payload = await verify_jwt(token)
     if not payload:
-        await send_json(
-            connection,
-            {"type": ERROR_TYPE, "payload": {"code": "auth_failed", "message": "Invalid or expired session token."}}
-        )
+        await safe_send(connection, AUTH_FAILED_MSG, text=True)
         await connection.close(code=4003, reason="auth_failed")
         return
         
@@ -317,23 +611,21 @@ async def handle_connection(connection: ServerConnection) -> None:
         await connection.close(code=1011, reason="join_failure")
         return
 
+    # State and room are fixed for the lifetime of this connection; if the room idles out,
+    # the connection is closed and the loop below exits.
+    state = client_states[connection]
+    room = rooms[state.room_code]
     try:
         async for message in connection:
-            state = client_states.get(connection)
-            if not state:
-                continue
             if over_rate_limit(state):
                 logger.warning(
                     "event=rate_limited room=%s ts=%s",
                     state.room_code,
                     compact_now(),
                 )
-                await send_json(
-                    connection,
-                    {"type": ERROR_TYPE, "payload": {"code": "rate_limited", "message": "Max 10 messages/sec."}},
-                )
+                await safe_send(connection, RATE_LIMITED_MSG, text=True)
                 continue
-            await relay_to_room(connection, message)
+            await relay_to_room(state, room, message)
     except ConnectionClosed:
         pass
     finally:
@@ -354,15 +646,23 @@ async def run(host: str, port: int) -> None:
             # Windows event loop may not support add_signal_handler for all signals.
             pass
 
+    _update_timestamps()
+    clock_task = asyncio.create_task(refresh_timestamps(stop_event))
     cleanup_task = asyncio.create_task(cleanup_idle_rooms(stop_event))
     logger.info("server_start ts=%s host=%s port=%d", compact_now(), host, port)
     try:
-        async with serve(handle_connection, host, port, max_size=2 * 1024 * 1024):
+        # Signaling frames are small SDP/ICE blobs; permessage-deflate costs more CPU and latency
+        # than it saves. TCP_NODELAY is already set on accepted sockets by asyncio and uvloop.
+        async with serve(handle_connection, host, port, max_size=2 * 1024 * 1024, compression=None):
             await stop_event.wait()
     finally:
-        cleanup_task.cancel()
-        with contextlib.suppress(asyncio.CancelledError):
-            await cleanup_task
+        for task in (cleanup_task, clock_task):
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        _update_timestamps()
+        await close_http_session()
+        _verify_pool.shutdown(wait=False)
         logger.info("server_stop ts=%s", compact_now())
 
 
@@ -385,4 +685,7 @@ def parse_args() -> argparse.Namespace:
 if __name__ == "__main__":
     args = parse_args()
     configure_logging()
-    asyncio.run(run(args.host, args.port))
+    if uvloop is not None:
+        uvloop.run(run(args.host, args.port))
+    else:
+        asyncio.run(run(args.host, args.port))
@@ -27,7 +27,7 @@ if token:
             print("Got pub key successfully.")
             
             try:
-                payload = jwt.decode(token, pub_key, algorithms=["RS256"])
+                payload = jwt.decode(token, pub_key, algorithms=["EdDSA"])
                 print("Payload decoded successfully:", payload)
             except Exception as e:
                 print("Decode Error:", e)
@@ -0,0 +1,101 @@
+import base64
+import json
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+from server import _jwt_decode_sync
+
+# server.py verifies the tokens we issue without jwt.decode; it must accept and reject exactly
+# what jwt.decode(token, key, algorithms=["EdDSA"]) does.
+PRIVATE_KEY = Ed25519PrivateKey.generate()
+PUBLIC_KEY = PRIVATE_KEY.public_key()
+OTHER_KEY = Ed25519PrivateKey.generate()
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def signed(header: dict, payload_bytes: bytes, key=PRIVATE_KEY) -> str:
+    signing_input = f"{b64(json.dumps(header).encode())}.{b64(payload_bytes)}"
+    return f"{signing_input}.{b64(key.sign(signing_input.encode()))}"
+
+
+def claims(**overrides) -> dict:
+    now = int(time.time())
+    payload = {"sub": "user", "device": "fp", "iat": now, "exp": now + 60, "jti": "j1", "username": "u"}
+    payload.update(overrides)
+    return {k: v for k, v in payload.items() if v is not None}
+
+
+def token(key=PRIVATE_KEY, headers=None, **overrides) -> str:
+    return jwt.encode(claims(**overrides), key, algorithm="EdDSA", headers=headers)
+
+
+def build_cases() -> dict:
+    now = int(time.time())
+    good = token()
+    header, payload, signature = good.split(".")
+    eddsa = {"alg": "EdDSA", "typ": "JWT"}
+    return {
+        "good": good,
+        "no_optional_claims": token(iat=None, jti=None, exp=None),
+        "expired": token(exp=now - 1),
+        "exp_string_past": token(exp="123"),
+        "exp_string_future": token(exp=str(now + 60)),
+        "exp_float": token(exp=now + 60.5),
+        "exp_bool": token(exp=True),
+        "exp_list": token(exp=[1]),
+        "exp_garbage": token(exp="soon"),
+        "iat_future": token(iat=now + 3600),
+        "iat_string": token(iat="abc"),
+        "iat_numeric_string": token(iat=str(now)),
+        "nbf_future": token(nbf=now + 100),
+        "aud": token(aud="x"),
+        "sub_not_string": token(sub=123),
+        "jti_not_string": token(jti=5),
+        "kid_header": token(headers={"kid": "1"}),
+        "kid_not_string": signed({**eddsa, "kid": 1}, json.dumps(claims()).encode()),
+        "crit_header": signed({**eddsa, "crit": ["exp"]}, json.dumps(claims()).encode()),
+        "wrong_key": token(key=OTHER_KEY),
+        "tampered_signature": f"{header}.{payload}.{signature[:-4]}AAAA",
+        "tampered_payload": f"{header}.{b64(json.dumps(claims(sub='admin')).encode())}.{signature}",
+        "non_base64_payload": f"{header}.{payload[:5]}!{payload[5:]}.{signature}",
+        "non_base64_header": f"{header[:3]}*{header[3:]}.{payload}.{signature}",
+        "non_base64_signature": f"{header}.{payload}.{signature[:4]}$${signature[4:]}",
+        "bad_padding": f"{header}===.{payload}.{signature}",
+        "padded": f"{header}.{payload}.{signature}" + "=" * (-len(signature) % 4),
+        "non_ascii": f"{header}.{payload}é.{signature}",
+        "garbage": "abc",
+        "empty": "",
+        "two_segments": "a.b",
+        "hs256": jwt.encode(claims(), "a-shared-secret-that-is-long-enough-for-hs256!", algorithm="HS256"),
+        "alg_none": jwt.encode(claims(), None, algorithm="none"),
+        "alg_missing": signed({"typ": "JWT"}, json.dumps(claims()).encode()),
+        "alg_empty": signed({"alg": ""}, json.dumps(claims()).encode()),
+        "header_not_object": signed([1], json.dumps(claims()).encode()),
+        "header_not_json": f"{b64(b'{nope')}.{payload}.{signature}",
+        "payload_not_object": signed(eddsa, b"[1, 2]"),
+        "payload_not_json": signed(eddsa, b"{nope"),
+    }
+
+
+def outcome(decode, value: str):
+    try:
+        return "ok", decode(value)
+    except jwt.PyJWTError as e:
+        return type(e).__name__, None
+
+
+def test_fast_path_matches_pyjwt() -> None:
+    for name, value in build_cases().items():
+        expected = outcome(lambda t: jwt.decode(t, PUBLIC_KEY, algorithms=["EdDSA"]), value)
+        actual = outcome(lambda t: _jwt_decode_sync(t, PUBLIC_KEY), value)
+        assert actual == expected, f"{name}: fast path {actual[0]}, jwt.decode {expected[0]}"
+
+
+if __name__ == "__main__":
+    test_fast_path_matches_pyjwt()
+    print("Fast-path JWT verification matches jwt.decode.")